@@ -17,13 +17,20 @@ Autor: Marcelo Ferreira Leda Filho
 Universidade Federal do Amazonas (UFAM)
 """
 
-from typing import Dict, List, Tuple, Optional, Set
+from typing import Callable, Dict, List, Tuple, Optional, Set
 from dataclasses import dataclass, field
-from collections import defaultdict
+from array import array
+from bisect import insort
+from itertools import repeat
+import sys
 import time
 
 
-@dataclass
+# Ranking atribuído a clientes ausentes da lista de um prestador
+RANK_INACEITAVEL = sys.maxsize
+
+
+@dataclass(slots=True)
 class Prestador:
     """Representa um prestador de serviços (hospital no problema HR)."""
     id: str
@@ -46,14 +53,14 @@ class Prestador:
         """Retorna o cliente menos preferido dentre os alocados."""
         if not self.clientes_alocados:
             return None
-        return max(self.clientes_alocados, key=lambda c: self.ranking(c))
+        return max(self.clientes_alocados, key=self.ranking)
     
     def tem_vaga(self) -> bool:
         """Verifica se há vagas disponíveis."""
         return len(self.clientes_alocados) < self.capacidade
 
 
-@dataclass
+@dataclass(slots=True)
 class Cliente:
     """Representa um cliente (residente no problema HR)."""
     id: str
@@ -79,7 +86,7 @@ class Cliente:
         return self.proximo_a_propor < len(self.preferencias)
 
 
-@dataclass
+@dataclass(slots=True)
 class ResultadoMatching:
     """Resultado do algoritmo de matching."""
     matching: Dict[str, List[str]]  # prestador_id -> lista de cliente_ids
@@ -90,6 +97,136 @@ class ResultadoMatching:
     vagas_nao_preenchidas: Dict[str, int]  # prestador_id -> num vagas vazias
 
 
+def _aceitacao_adiada(pref: List[List[int]], rank: List[List[int]], cap: List[int],
+                      ao_fim_da_rodada: Optional[Callable] = None):
+    """
+    Núcleo do Deferred Acceptance sobre índices inteiros.
+    
+    Recebe apenas listas de inteiros e não acessa nenhum objeto do modelo,
+    de modo que todo o estado do laço fica em variáveis locais.
+    
+    Args:
+        pref: pref[c] = prestadores na ordem de preferência do cliente c (-1 = desconhecido).
+        rank: rank[p][c] = posição do cliente c na lista do prestador p.
+        cap: cap[p] = capacidade do prestador p.
+        ao_fim_da_rodada: Chamado ao fim de cada rodada com (rodada, propostas,
+            rejeicoes, alocado_para, proximo, alocados), onde propostas contém
+            tuplas (cliente, posição proposta, aceita) e rejeicoes tuplas
+            (cliente, prestador). Se None, propostas e rejeições não são registradas.
+    
+    Returns:
+        Tupla (alocado_para, proximo, alocados, num_rodadas, num_propostas), onde
+        alocados[p] é a lista de pares (rank, cliente) aceitos, em ordem de ranking.
+    """
+    n = len(pref)
+    num_rodadas = 0
+    num_propostas = 0
+    
+    alocado_para = [-1] * n
+    proximo = [0] * n
+    alocados: List[List[Tuple[int, int]]] = [[] for _ in cap]
+    registrar = ao_fim_da_rodada is not None
+    
+    # Propostas recebidas por prestador na rodada, alocadas uma única vez;
+    # `tocados` lista os prestadores que receberam alguma proposta
+    propostas_por_prestador: List[List[Tuple[int, int]]] = [[] for _ in cap]
+    tocados: List[int] = []
+    
+    # Filas de clientes livres com propostas restantes: a da rodada atual e a
+    # da próxima, trocadas a cada rodada. Só entra na fila quem acabou de
+    # ficar livre, então não há varredura de todos os clientes.
+    clientes_livres = [c for c in range(n) if pref[c]]
+    proximos_livres: List[int] = []
+    
+    while clientes_livres:
+        num_rodadas += 1
+        if registrar:
+            propostas = []
+            rejeicoes = []
+        
+        # Fase de propostas
+        for c in clientes_livres:
+            pref_c = pref[c]
+            k = proximo[c]
+            proximo[c] = k + 1
+            p = pref_c[k]
+            
+            num_propostas += 1
+            
+            # Uma única consulta dá a aceitação e o ranking usado na avaliação
+            r = rank[p][c] if p >= 0 else RANK_INACEITAVEL
+            if r != RANK_INACEITAVEL:
+                balde = propostas_por_prestador[p]
+                if not balde:
+                    tocados.append(p)
+                balde.append((r, c))
+                if registrar:
+                    propostas.append((c, k, True))
+            else:
+                if registrar:
+                    propostas.append((c, k, False))
+                if k + 1 < len(pref_c):
+                    proximos_livres.append(c)
+        
+        # Fase de avaliação pelos prestadores
+        for p in tocados:
+            novos_clientes = propostas_por_prestador[p]
+            atuais = alocados[p]
+            
+            # Caso comum após as primeiras rodadas: um único candidato novo.
+            # Como `atuais` está ordenado, o pior é o último e basta compará-lo
+            if len(novos_clientes) == 1:
+                novo = novos_clientes.pop()
+                if len(atuais) < cap[p]:
+                    insort(atuais, novo)
+                    alocado_para[novo[1]] = p
+                    continue
+                if not atuais or novo > atuais[-1]:
+                    rejeitado = novo[1]
+                else:
+                    rejeitado = atuais.pop()[1]
+                    insort(atuais, novo)
+                    alocado_para[novo[1]] = p
+                alocado_para[rejeitado] = -1
+                if proximo[rejeitado] < len(pref[rejeitado]):
+                    proximos_livres.append(rejeitado)
+                if registrar:
+                    rejeicoes.append((rejeitado, p))
+                continue
+            
+            # Junta clientes atuais com novos candidatos e esvazia o balde
+            novos_clientes.sort()
+            todos_candidatos = atuais + novos_clientes
+            novos_clientes.clear()
+            
+            # `atuais` e os novos formam duas sequências ordenadas de pares
+            # (rank, cliente): o Timsort as intercala em O(κ + novos), sem chave
+            todos_candidatos.sort()
+            aceitos = todos_candidatos[:cap[p]]
+            
+            # Atualiza alocações
+            alocados[p] = aceitos
+            
+            for _, c in aceitos:
+                alocado_para[c] = p
+            
+            for _, c in todos_candidatos[cap[p]:]:
+                alocado_para[c] = -1
+                if proximo[c] < len(pref[c]):
+                    proximos_livres.append(c)
+                if registrar:
+                    rejeicoes.append((c, p))
+        
+        tocados.clear()
+        clientes_livres, proximos_livres = proximos_livres, clientes_livres
+        proximos_livres.clear()
+        
+        if registrar:
+            ao_fim_da_rodada(num_rodadas, propostas, rejeicoes, alocado_para, proximo, alocados)
+    
+    return alocado_para, proximo, alocados, num_rodadas, num_propostas
+
+
 class DeferredAcceptance:
     """
     Implementação do algoritmo Deferred Acceptance (Gale-Shapley).
@@ -98,113 +235,100 @@ class DeferredAcceptance:
     que produz o matching estável ótimo para os clientes.
     
     Complexidade de tempo: O(n * m), onde n = número de clientes e m = número de prestadores
-    Complexidade de espaço: O(n + m)
+    Complexidade de espaço: O(n * m) (tabela de rankings dos prestadores)
     """
     
     def __init__(self, prestadores: List[Prestador], clientes: List[Cliente]):
         self.prestadores = {p.id: p for p in prestadores}
         self.clientes = {c.id: c for c in clientes}
+        
         self.num_propostas = 0
         self.num_rodadas = 0
         self.historico_rodadas: List[Dict] = []
     
-    def executar(self, verbose: bool = False) -> ResultadoMatching:
+    def _construir_tabelas(self):
+        """
+        Converte as preferências para índices inteiros (estrutura de arrays).
+        
+        Clientes e prestadores passam a ser identificados pela posição em
+        `_ids_clientes` e `_ids_prestadores`; os IDs textuais só são usados
+        na entrada e na montagem do resultado.
+        """
+        self._ids_prestadores = list(self.prestadores)
+        self._ids_clientes = list(self.clientes)
+        self._idx_prestadores = idx_prestador = {
+            p_id: i for i, p_id in enumerate(self._ids_prestadores)
+        }
+        self._idx_clientes = idx_cliente = {
+            c_id: j for j, c_id in enumerate(self._ids_clientes)
+        }
+        n = len(self._ids_clientes)
+        
+        # Linhas em array.array: inteiros sem boxing, bem menores que listas de
+        # int. Os IDs são traduzidos com map(), sem laço Python por entrada
+        
+        # _pref[c]: prestadores na ordem de preferência do cliente (-1 = desconhecido)
+        self._pref = [
+            array('q', map(idx_prestador.get, c.preferencias, repeat(-1)))
+            for c in self.clientes.values()
+        ]
+        
+        # _rank[p][c]: posição do cliente c na lista do prestador p. A lista é
+        # percorrida de trás para frente para que a primeira ocorrência de um
+        # cliente prevaleça (como em Prestador.ranking); IDs desconhecidos caem
+        # na posição extra n, nunca consultada
+        vazia = array('q', [RANK_INACEITAVEL]) * (n + 1)
+        self._rank = []
+        for p in self.prestadores.values():
+            linha = vazia[:]
+            prefs = p.preferencias
+            posicoes = range(len(prefs) - 1, -1, -1)
+            for i, j in zip(posicoes, map(idx_cliente.get, reversed(prefs), repeat(n))):
+                linha[j] = i
+            self._rank.append(linha)
+        
+        self._cap = array('q', [p.capacidade for p in self.prestadores.values()])
+    
+    def executar(self, verbose: bool = False,
+                 registrar_historico: bool = False) -> ResultadoMatching:
         """
         Executa o algoritmo Deferred Acceptance.
         
         Args:
             verbose: Se True, imprime o progresso de cada rodada.
+            registrar_historico: Se True, preenche `historico_rodadas` mesmo sem
+                verbose. Desligado por padrão para não alocar um registro por
+                proposta quando o histórico não é consultado.
             
         Returns:
             ResultadoMatching com o matching estável encontrado.
         """
         inicio = time.time()
         
+        # A conversão para índices é O(n * m) e faz parte do custo medido;
+        # refeita a cada execução para refletir alterações nos objetos
+        self._construir_tabelas()
+        
         # Reset do estado
-        for p in self.prestadores.values():
-            p.clientes_alocados = []
-        for c in self.clientes.values():
-            c.proximo_a_propor = 0
-            c.alocado_para = None
         self.num_propostas = 0
         self.num_rodadas = 0
         self.historico_rodadas = []
         
-        # Conjunto de clientes livres com propostas restantes
-        clientes_livres = {c_id for c_id, c in self.clientes.items() 
-                          if c.tem_propostas_restantes()}
-        
-        while clientes_livres:
-            self.num_rodadas += 1
-            rodada_info = {'rodada': self.num_rodadas, 'propostas': [], 'rejeicoes': []}
-            
-            # Fase de propostas
-            propostas_por_prestador: Dict[str, List[str]] = defaultdict(list)
-            
-            for cliente_id in list(clientes_livres):
-                cliente = self.clientes[cliente_id]
-                prestador_id = cliente.proximo_prestador()
-                
-                if prestador_id is None:
-                    clientes_livres.discard(cliente_id)
-                    continue
-                
-                self.num_propostas += 1
-                prestador = self.prestadores.get(prestador_id)
-                
-                if prestador and prestador.aceita(cliente_id):
-                    propostas_por_prestador[prestador_id].append(cliente_id)
-                    rodada_info['propostas'].append((cliente_id, prestador_id, 'aceita'))
-                else:
-                    rodada_info['propostas'].append((cliente_id, prestador_id, 'rejeitada'))
-            
-            # Fase de avaliação pelos prestadores
-            for prestador_id, novos_clientes in propostas_por_prestador.items():
-                prestador = self.prestadores[prestador_id]
-                
-                # Junta clientes atuais com novos candidatos
-                todos_candidatos = prestador.clientes_alocados + novos_clientes
-                
-                # Ordena por preferência (menor índice = mais preferido)
-                todos_candidatos.sort(key=lambda c: prestador.ranking(c))
-                
-                # Mantém os melhores até a capacidade
-                aceitos = todos_candidatos[:prestador.capacidade]
-                rejeitados = todos_candidatos[prestador.capacidade:]
-                
-                # Atualiza alocações
-                prestador.clientes_alocados = aceitos
-                
-                for cliente_id in aceitos:
-                    self.clientes[cliente_id].alocado_para = prestador_id
-                    clientes_livres.discard(cliente_id)
-                
-                for cliente_id in rejeitados:
-                    self.clientes[cliente_id].alocado_para = None
-                    if self.clientes[cliente_id].tem_propostas_restantes():
-                        clientes_livres.add(cliente_id)
-                    else:
-                        clientes_livres.discard(cliente_id)
-                    rodada_info['rejeicoes'].append((cliente_id, prestador_id))
-            
-            self.historico_rodadas.append(rodada_info)
-            
-            if verbose:
-                self._imprimir_rodada(rodada_info)
-            
-            # Atualiza conjunto de clientes livres
-            clientes_livres = {c_id for c_id, c in self.clientes.items()
-                             if c.esta_livre() and c.tem_propostas_restantes()}
+        alocado_para, proximo, alocados = self._executar_numerico(
+            verbose, registrar_historico or verbose)
+        self._sincronizar(alocado_para, proximo, alocados)
         
         tempo_execucao = time.time() - inicio
         
-        # Monta resultado
+        # Monta resultado direto do estado numérico
+        ids_p = self._ids_prestadores
+        ids_c = self._ids_clientes
         matching = {p_id: list(p.clientes_alocados) for p_id, p in self.prestadores.items()}
-        clientes_nao_alocados = [c_id for c_id, c in self.clientes.items() if c.esta_livre()]
+        clientes_nao_alocados = [ids_c[c] for c, p in enumerate(alocado_para) if p < 0]
         vagas_nao_preenchidas = {
-            p_id: p.capacidade - len(p.clientes_alocados)
-            for p_id, p in self.prestadores.items()
-            if len(p.clientes_alocados) < p.capacidade
+            ids_p[p]: vagas
+            for p, vagas in enumerate(k - len(a) for k, a in zip(self._cap, alocados))
+            if vagas > 0
         }
         
         return ResultadoMatching(
@@ -216,6 +340,47 @@ class DeferredAcceptance:
             vagas_nao_preenchidas=vagas_nao_preenchidas
         )
     
+    def _executar_numerico(self, verbose: bool = False, registrar: bool = False):
+        """
+        Executa o núcleo numérico e, se `registrar`, guarda o histórico com os IDs originais.
+        
+        Returns:
+            Tupla (alocado_para, proximo, alocados) devolvida por _aceitacao_adiada.
+        """
+        ids_p = self._ids_prestadores
+        ids_c = self._ids_clientes
+        prefs_originais = [c.preferencias for c in self.clientes.values()]
+        
+        def ao_fim_da_rodada(rodada, propostas, rejeicoes, alocado_para, proximo, alocados):
+            rodada_info = {
+                'rodada': rodada,
+                'propostas': [
+                    (ids_c[c], prefs_originais[c][k], 'aceita' if aceita else 'rejeitada')
+                    for c, k, aceita in propostas
+                ],
+                'rejeicoes': [(ids_c[c], ids_p[p]) for c, p in rejeicoes],
+            }
+            self.historico_rodadas.append(rodada_info)
+            if verbose:
+                self._sincronizar(alocado_para, proximo, alocados)
+                self._imprimir_rodada(rodada_info)
+        
+        alocado_para, proximo, alocados, self.num_rodadas, self.num_propostas = \
+            _aceitacao_adiada(self._pref, self._rank, self._cap,
+                              ao_fim_da_rodada if registrar else None)
+        return alocado_para, proximo, alocados
+    
+    def _sincronizar(self, alocado_para: List[int], proximo: List[int],
+                     alocados: List[List[Tuple[int, int]]]):
+        """Copia o estado numérico de volta para os objetos Prestador e Cliente."""
+        ids_p = self._ids_prestadores
+        ids_c = self._ids_clientes
+        for p, prestador in enumerate(self.prestadores.values()):
+            prestador.clientes_alocados = [ids_c[c] for _, c in alocados[p]]
+        for c, cliente in enumerate(self.clientes.values()):
+            cliente.proximo_a_propor = proximo[c]
+            cliente.alocado_para = ids_p[alocado_para[c]] if alocado_para[c] >= 0 else None
+    
     def _imprimir_rodada(self, rodada_info: Dict):
         """Imprime informações de uma rodada."""
         print(f"\n{'='*60}")
@@ -252,32 +417,45 @@ class DeferredAcceptance:
         Returns:
             Tupla (é_estável, lista_de_pares_bloqueadores)
         """
-        pares_bloqueadores = []
+        # Tabelas refeitas a partir dos objetos: o verificador não confia no
+        # estado guardado pela última execução
+        self._construir_tabelas()
+        ids_p = self._ids_prestadores
+        ids_c = self._ids_clientes
+        idx_p = self._idx_prestadores
+        idx_c = self._idx_clientes
+        pref = self._pref
+        rank = self._rank
         
-        for cliente_id, cliente in self.clientes.items():
-            prestador_atual = cliente.alocado_para
-            
-            # Para cada prestador que o cliente prefere ao atual
-            for i, prestador_id in enumerate(cliente.preferencias):
-                if prestador_id == prestador_atual:
-                    break  # Já chegou no prestador atual, não há mais preferidos
-                
-                prestador = self.prestadores.get(prestador_id)
-                if not prestador:
-                    continue
-                
-                # Verifica se o prestador também prefere este cliente
-                if not prestador.aceita(cliente_id):
-                    continue
-                
-                # Verifica se o prestador tem vaga ou prefere este cliente a algum atual
-                if prestador.tem_vaga():
-                    pares_bloqueadores.append((cliente_id, prestador_id))
-                else:
-                    # Verifica se prefere este cliente ao pior dos atuais
-                    pior_atual = prestador.pior_cliente()
-                    if pior_atual and prestador.ranking(cliente_id) < prestador.ranking(pior_atual):
-                        pares_bloqueadores.append((cliente_id, prestador_id))
+        # Limiar de cada prestador, calculado da alocação atual dos objetos:
+        # com vaga, bloqueia qualquer cliente aceitável; cheio, só os que ele
+        # prefere ao pior dos atuais
+        limiar = []
+        for p, prestador in enumerate(self.prestadores.values()):
+            if prestador.tem_vaga():
+                limiar.append(RANK_INACEITAVEL)
+            else:
+                linha = rank[p]
+                limiar.append(max(
+                    (linha[idx_c[c]] if c in idx_c else RANK_INACEITAVEL
+                     for c in prestador.clientes_alocados),
+                    default=-1
+                ))
+        
+        # Ranking de cada prestador na lista do cliente (primeira ocorrência),
+        # para limitar a varredura aos estritamente preferidos ao atual
+        rank_clientes = [
+            dict(zip(reversed(linha), range(len(linha) - 1, -1, -1)))
+            for linha in pref
+        ]
+        
+        # Um par (c, p) bloqueia se c prefere p ao atual e rank[p][c] < limiar[p]
+        pares_bloqueadores = [
+            (ids_c[c], ids_p[p])
+            for c, cliente in enumerate(self.clientes.values())
+            for p in pref[c][:rank_clientes[c].get(idx_p.get(cliente.alocado_para), len(pref[c]))]
+            if p >= 0 and rank[p][c] < limiar[p]
+        ]
         
         return len(pares_bloqueadores) == 0, pares_bloqueadores
 
@@ -425,10 +603,13 @@ def experimentos_escala():
         n_prestadores = max(3, n_clientes // 5)
         capacidade_media = (n_clientes // n_prestadores) + 1
         
-        # Gera instância aleatória
+        # Gera instância aleatória (IDs formatados uma vez e embaralhados por cópia)
+        base_clientes = [f"C{j}" for j in range(n_clientes)]
+        base_prestadores = [f"P{i}" for i in range(n_prestadores)]
+        
         prestadores = []
         for i in range(n_prestadores):
-            clientes_ids = [f"C{j}" for j in range(n_clientes)]
+            clientes_ids = base_clientes.copy()
             random.shuffle(clientes_ids)
             prestadores.append(Prestador(
                 id=f"P{i}",
@@ -439,7 +620,7 @@ def experimentos_escala():
         
         clientes = []
         for j in range(n_clientes):
-            prestadores_ids = [f"P{i}" for i in range(n_prestadores)]
+            prestadores_ids = base_prestadores.copy()
             random.shuffle(prestadores_ids)
             clientes.append(Cliente(
                 id=f"C{j}",